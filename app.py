@@ -2,188 +2,270 @@ import fitz   # PyMuPDF
 import re
 import pandas as pd
 import streamlit as st
+import xlsxwriter
 import io
-from typing import Tuple, Optional, List
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterator, List, Tuple
+
+# Patterns are compiled once at import and applied column-wise by classify_dimensions.
+# Alternatives are in priority order: anchored at the start, each branch scans the
+# whole text before the next one is tried.
+
+# Nominal values: the first decimal number, else the first whole number, so
+# "2X Ø6.5 THRU" gives 6.5 rather than the leading quantity
+_NOMINAL_RE = re.compile(
+    r"^(?:"
+    r".*?(?P<dec>\d+\.\d+)"  # Decimal numbers (priority)
+    r"|.*?(?P<whole>\d+)"    # Whole numbers
+    r")"
+)
+
+# Tolerance formats: "M6x1-6H ±0.1" gives "±0.1" rather than the leftmost "-6"
+_TOL_RE = re.compile(
+    r"^(?:"
+    r".*?(?P<pm_dec>±\s*\d+\.\d+)"              # ± decimal
+    r"|.*?(?P<pm_whole>±\s*\d+)"                # ± whole number
+    r"|.*?(?P<split_dec>[+]\d+\.\d+/-\d+\.\d+)"  # +x.x/-x.x format
+    r"|.*?(?P<split_whole>[+]\d+/-\d+)"         # +x/-x format
+    r"|.*?(?P<signed_dec>[+\-]\d+\.\d+)"        # + or - decimal
+    r"|.*?(?P<signed_whole>[+\-]\d+)"           # + or - whole number
+    r")"
+)
+
+# Balloon numbers: "1 dimension", "1. dimension", "1: dimension"
+_BALLOON_RE = re.compile(r"^(\d+)(?:\s+|[\.\-\:]\s*)(.+)")
+_BALLOON_PAREN_RE = re.compile(r"^\((\d+)\)\s*(.+)")  # "(1) dimension", "(3)R5"
+_BALLOON_FLEX_RE = re.compile(r"^(\d+)\W*(.+)")  # Fallback for unseparated forms: "1Ø12"
+_BALLOON_START = "0123456789("  # Every balloon format starts with one of these
+
+# The flags "text", "words" and "blocks" each default to when they build their own
+# TextPage: ligatures and whitespace kept as-is, clipped to the page. Passed
+# explicitly because get_textpage() defaults to flags=0.
+_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT
+
+# (parameter, instrument, pattern) in priority order; dimensions matching none of
+# them are lengths. Roughness codes stay case-sensitive: "RA" in any case would
+# also hit words such as "PARALLEL". Chamfers need both a "°" and an X or CHAM
+# anywhere in the text; anchored lookaheads test that with one scan each, where
+# °.*X|X.*° would rescan the rest of the text from every "°" and X.
+_PARAMETER_RULES = [
+    ("Diameter", "DVC", re.compile(r"Ø|DIA", re.IGNORECASE)),
+    ("Radius", "VMS/IMM", re.compile(r"^R|RADIUS| R ", re.IGNORECASE)),
+    ("Thread", "Thread Gauge", re.compile(r"M\d+|THREAD", re.IGNORECASE)),
+    ("Chamfer", "VMS/IMM", re.compile(r"^(?=.*°)(?=.*(?:X|CHAM))", re.IGNORECASE)),
+    ("Angle", "VMS/IMM", re.compile(r"°|ANGLE|DEG", re.IGNORECASE)),
+    ("Surface Roughness", "Surface Tester", re.compile(r"(?-i:R[azt])|SURFACE", re.IGNORECASE)),
+    ("Concentricity/Runout", "CMM", re.compile(r"⌖|↗|CONC|RUNOUT", re.IGNORECASE)),
+]
+_PARAMETER_TRIGGERS = re.compile(r"[ØDRMTACS°⌖↗]", re.IGNORECASE)  # Needed by every rule above
+
+# (type, pattern) in priority order
+_TYPE_RULES = [
+    ("C", re.compile(r"\bC\b|CRITICAL", re.IGNORECASE)),
+    ("S", re.compile(r"\bS\b|SPEC", re.IGNORECASE)),
+    ("K", re.compile(r"KEY|MAJOR", re.IGNORECASE)),  # Key dimension
+]
+_TYPE_TRIGGERS = re.compile(r"[CSKM]", re.IGNORECASE)
 
 st.set_page_config(page_title="Drawing Dimension Extractor", page_icon="📐", layout="wide")
 st.title("📐 Drawing Dimension Extractor to Excel")
 st.markdown("Extract dimensional information from 2D technical drawings and export to Excel format.")
 
-def parse_dimension(line: str) -> Tuple[str, Optional[float], str, str, str]:
+def classify_dimensions(texts: pd.Series) -> pd.DataFrame:
     """
-    Enhanced dimension parsing with better pattern recognition
+    Parse and classify all dimension texts at once with vectorized string operations
     """
-    # Clean the line
-    line = line.strip()
-    
-    # Default values
-    desc = "Dimension"
-    nominal = None
-    tol = "±0.10"  # default tolerance
-    typ = ""
-    inst = ""
-    
-    # Enhanced nominal value extraction (handles decimals, fractions, multiple numbers)
-    nominal_patterns = [
-        r"(\d+\.\d+)",      # Decimal numbers (priority)
-        r"(\d+)",           # Whole numbers
-        r"(\d+/\d+)",       # Fractions
-        r"(\d+\s\d+/\d+)"   # Mixed numbers
-    ]
+    result = pd.DataFrame(index=texts.index)
     
-    for pattern in nominal_patterns:
-        m_val = re.search(pattern, line)
-        if m_val:
-            try:
-                val_str = m_val.group(1)
-                if '/' in val_str:
-                    # Handle fractions
-                    if ' ' in val_str:  # Mixed number
-                        whole, frac = val_str.split(' ', 1)
-                        num, den = frac.split('/')
-                        nominal = float(whole) + float(num) / float(den)
-                    else:  # Simple fraction
-                        num, den = val_str.split('/')
-                        nominal = float(num) / float(den)
-                else:
-                    nominal = float(val_str)
-                break
-            except (ValueError, ZeroDivisionError):
-                continue
+    # Enhanced nominal value extraction
+    parts = texts.str.extract(_NOMINAL_RE)
+    # float() accepts every digit \d matches and overflows to inf, so no callout
+    # can fail the conversion
+    result["Nominal Value"] = parts["dec"].fillna(parts["whole"]).map(float, na_action="ignore")
     
     # Enhanced tolerance extraction
-    tol_patterns = [
-        r"(±\s*\d+\.\d+)",          # ± decimal
-        r"(±\s*\d+)",               # ± whole number
-        r"([+]\d+\.\d+/-\d+\.\d+)", # +x.x/-x.x format
-        r"([+]\d+/-\d+)",           # +x/-x format
-        r"([+\-]\d+\.\d+)",         # + or - decimal
-        r"([+\-]\d+)"               # + or - whole number
-    ]
+    # Only the winning branch's group is set; take it from whichever column it is in
+    groups = texts.str.extract(_TOL_RE)
+    tolerance = groups.iloc[:, 0]
+    for col in groups.columns[1:]:
+        tolerance = tolerance.fillna(groups[col])
+    result["Tolerance"] = tolerance.str.replace(" ", "").fillna("±0.10")  # default tolerance
     
-    for pattern in tol_patterns:
-        m_tol = re.search(pattern, line)
-        if m_tol:
-            tol = m_tol.group(1).replace(' ', '')
-            break
+    # Critical / Specification type detection. Python re runs these rules: its \b
+    # is Unicode-aware, while pyarrow's is ASCII-only and would read the "S" of
+    # "SØ20" as a standalone spec marker. Texts without a trigger character can't
+    # match any rule and keep the default without reaching them.
+    result["Type (C/S)"] = ""
+    pending = texts[texts.str.contains(_TYPE_TRIGGERS)].astype(object)
+    for typ, pattern in _TYPE_RULES:
+        matched = pending.str.contains(pattern)
+        result.loc[pending.index[matched], "Type (C/S)"] = typ
+        pending = pending[~matched]
     
-    # Enhanced classification with more patterns
-    line_upper = line.upper()
+    # Parameter classification: each rule only scans the rows no earlier rule claimed.
+    # Plain lengths, the most common callouts, contain no trigger character and are
+    # settled by that one check instead of falling through every rule.
+    result["Parameter"] = "Length"
+    result["Instrument"] = "DVC"
+    pending = texts[texts.str.contains(_PARAMETER_TRIGGERS)]
+    for param, instrument, pattern in _PARAMETER_RULES:
+        matched = pending.str.contains(pattern)
+        result.loc[pending.index[matched], ["Parameter", "Instrument"]] = [param, instrument]
+        pending = pending[~matched]
     
-    # Diameter detection
-    if any(symbol in line for symbol in ["Ø", "DIA", "DIAM"]) or "DIAMETER" in line_upper:
-        desc = "Diameter"
-        inst = "DVC"
+    return result
+
+def get_page_lines(page, textpage, method_name: str) -> List[str]:
+    """
+    Extract the text lines of a page with one PyMuPDF extraction method
+    """
+    if method_name == "text":
+        return page.get_text("text", textpage=textpage).splitlines()
+    
+    if method_name == "words":
+        # Rejoin words sharing a (block_no, line_no); the flat word tuples are far
+        # cheaper to build than the nested per-span "dict" output
+        words = page.get_text("words", textpage=textpage)
+        return [
+            " ".join(word[4] for word in line_words)
+            for _, line_words in groupby(words, key=itemgetter(5, 6))
+        ]
     
-    # Radius detection
-    elif line.startswith("R") or "RADIUS" in line_upper or " R " in line:
-        desc = "Radius"
-        inst = "VMS/IMM"
+    # blocks
+    return [block[4] for block in page.get_text("blocks", textpage=textpage) if len(block) > 4]
+
+def extract_dimensions_from_lines(lines: List[str], page_num: int) -> List[Tuple[int, str, str]]:
+    """
+    Extract balloon-numbered dimensions from the text lines of one page
+    """
+    page_data = []
     
-    # Thread detection
-    elif re.search(r"M\d+", line) or "THREAD" in line_upper:
-        desc = "Thread"
-        inst = "Thread Gauge"
+    for line in lines:
+        line = line.strip()
+        # Titles, notes and border text are skipped before any regex work
+        if not line or line[0] not in _BALLOON_START:
+            continue
+        
+        # Look for balloon numbers; the fallback only runs when the other forms fail
+        for pattern in (_BALLOON_RE, _BALLOON_PAREN_RE, _BALLOON_FLEX_RE):
+            match = pattern.match(line)
+            if match:
+                try:
+                    sr_no = int(match.group(1))
+                    dim_text = match.group(2).strip()
+                    
+                    if dim_text and len(dim_text) > 1:  # Valid dimension text
+                        page_data.append((sr_no, dim_text, f"Page {page_num}"))
+                        break
+                except (ValueError, IndexError):
+                    continue
     
-    # Chamfer detection
-    elif ("°" in line and any(x in line_upper for x in ["X", "CHAM", "CHAMFER"])) or \
-         re.search(r"\d+\s*[Xx]\s*\d+°", line):
-        desc = "Chamfer"
-        inst = "VMS/IMM"
+    return page_data
+
+def extract_page(page) -> List[Tuple[int, str, str]]:
+    """
+    Extract the dimension rows of one page
+    """
+    # The page content is interpreted once into a TextPage that every method reads
+    textpage = page.get_textpage(flags=_TEXT_FLAGS)
     
-    # Angle detection
-    elif "°" in line or "ANGLE" in line_upper or "DEG" in line_upper:
-        desc = "Angle"
-        inst = "VMS/IMM"
+    # Plain text is by far the cheapest method; "words" and "blocks" are
+    # only built for pages it yields nothing for
+    for method_name in ("text", "words", "blocks"):
+        page_data = extract_dimensions_from_lines(get_page_lines(page, textpage, method_name), page.number + 1)
+        if page_data:
+            break
     
-    # Surface roughness
-    elif any(symbol in line for symbol in ["Ra", "Rz", "Rt"]) or "SURFACE" in line_upper:
-        desc = "Surface Roughness"
-        inst = "Surface Tester"
+    return page_data
+
+def iter_dimensions(pdf_bytes: bytes) -> Iterator[Tuple[int, str, str]]:
+    """
+    Yield (Sr. No., dimension text, page) rows from a PDF in page order
+    """
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            yield from extract_page(page)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def extract_dimensions_from_pdf(pdf_bytes: bytes) -> pd.DataFrame:
+    """
+    Extract and classify the dimensions of a PDF, memoized on the file content so
+    widget changes rerunning the script don't parse the PDF again
+    """
+    # Sort the row tuples by Sr. No. before building the frame, which saves a
+    # DataFrame sort and index rebuild; the stable sort keeps page order for ties
+    rows = sorted(iter_dimensions(pdf_bytes), key=itemgetter(0))
+    df = pd.DataFrame(rows, columns=["Sr. No.", "Dimension Text", "Page"])
     
-    # Concentricity/Runout
-    elif any(symbol in line for symbol in ["⌖", "↗"]) or "CONC" in line_upper or "RUNOUT" in line_upper:
-        desc = "Concentricity/Runout"
-        inst = "CMM"
+    if not df.empty:
+        # Classify every dimension in one pass per rule
+        df = pd.concat([df, classify_dimensions(df["Dimension Text"])], axis=1)
+        
+        # Low-cardinality columns: the sidebar filters then compare integer codes
+        for col in ("Parameter", "Type (C/S)"):
+            df[col] = df[col].astype("category")
     
-    # Default to length
-    else:
-        desc = "Length"
-        inst = "DVC"
+    return df
+
+def column_width(values: pd.Series) -> int:
+    """
+    Characters needed by the widest value of a column, ignoring missing values
+    """
+    values = values.dropna()
+    if values.empty:
+        return 0
     
-    # Critical / Specification type detection
-    if re.search(r"\bC\b", line_upper) or "CRITICAL" in line_upper:
-        typ = "C"
-    elif re.search(r"\bS\b", line_upper) or "SPEC" in line_upper:
-        typ = "S"
-    elif "KEY" in line_upper or "MAJOR" in line_upper:
-        typ = "K"  # Key dimension
+    if pd.api.types.is_integer_dtype(values):
+        # The extremes carry the most digits and the sign, so only those two are
+        # formatted; floats can be widest anywhere in between and are all formatted
+        values = values.agg(["min", "max"])
+    if pd.api.types.is_numeric_dtype(values):
+        values = values.astype(str)
     
-    return desc, nominal, tol, typ, inst
+    return int(values.str.len().max())
 
-def extract_dimensions_from_pdf(pdf_file) -> List[List]:
+@st.cache_data(max_entries=16, show_spinner=False)
+def build_xlsx(df: pd.DataFrame, param_counts: pd.Series) -> bytes:
     """
-    Extract dimensions from PDF with improved text parsing
+    Build the Excel workbook for the dimensions and their parameter summary, memoized
+    on the frames so reruns that leave the filters unchanged reuse the same bytes
     """
-    doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-    data = []
+    output = io.BytesIO()
+    # Rows are written strictly in order, so each one can be flushed as soon as
+    # the next starts instead of holding the whole sheet in memory
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
     
-    for page_num, page in enumerate(doc, 1):
-        # Try different text extraction methods
-        text_methods = [
-            ("text", page.get_text("text")),
-            ("dict", page.get_text("dict")),
-            ("blocks", page.get_text("blocks"))
-        ]
-        
-        for method_name, text_content in text_methods:
-            if method_name == "text":
-                lines = text_content.splitlines()
-            elif method_name == "dict":
-                # Extract text from dictionary format
-                lines = []
-                for block in text_content.get("blocks", []):
-                    if "lines" in block:
-                        for line in block["lines"]:
-                            for span in line.get("spans", []):
-                                if span.get("text", "").strip():
-                                    lines.append(span["text"].strip())
-            else:  # blocks
-                lines = [block[4] for block in text_content if len(block) > 4]
-            
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Look for balloon numbers (various formats)
-                balloon_patterns = [
-                    r"^(\d+)\s+(.+)",           # Standard: "1 dimension"
-                    r"^\((\d+)\)\s*(.+)",       # Parentheses: "(1) dimension"
-                    r"^(\d+)[\.\-\:]\s*(.+)",   # With separators: "1. dimension"
-                    r"(\d+)\s*[^\d\w]*(.+)"     # Flexible: "1 - dimension"
-                ]
-                
-                for pattern in balloon_patterns:
-                    match = re.match(pattern, line)
-                    if match:
-                        try:
-                            sr_no = int(match.group(1))
-                            dim_text = match.group(2).strip()
-                            
-                            if dim_text and len(dim_text) > 1:  # Valid dimension text
-                                desc, nominal, tol, typ, inst = parse_dimension(dim_text)
-                                data.append([sr_no, desc, nominal, tol, typ, inst, f"Page {page_num}"])
-                                break
-                        except (ValueError, IndexError):
-                            continue
-            
-            # If we found data with this method, use it
-            if data:
-                break
+    # Add formatting
+    header_format = workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'valign': 'top',
+        'fg_color': '#D7E4BC',
+        'border': 1
+    })
+    
+    # Write main data, blanking missing values; overflowed nominals are written as
+    # "inf" like to_excel did, since xlsxwriter rejects infinite numbers
+    worksheet = workbook.add_worksheet('Dimensions')
+    worksheet.write_row(0, 0, df.columns, header_format)
+    cells = df.astype(object).where(df.notna(), None).replace({float("inf"): "inf"})
+    for row_num, row in enumerate(cells.itertuples(index=False), 1):
+        worksheet.write_row(row_num, 0, row)
     
-    doc.close()
-    return data
+    # Auto-adjust column widths
+    for i, col in enumerate(df.columns):
+        max_length = max(column_width(df[col]), len(col))
+        worksheet.set_column(i, i, min(max_length + 2, 20))
+    
+    # Create summary sheet
+    summary = workbook.add_worksheet('Summary')
+    summary.write_row(0, 0, ['Parameter Type', 'Count'], header_format)
+    for row_num, (param, count) in enumerate(param_counts.items(), 1):
+        summary.write_row(row_num, 0, [param, int(count)])
+    
+    workbook.close()
+    return output.getvalue()
 
 # Sidebar for configuration
 st.sidebar.header("Configuration")
@@ -213,16 +295,13 @@ if uploaded_file:
     # Process the PDF
     with st.spinner("Extracting dimensions from PDF..."):
         try:
-            data = extract_dimensions_from_pdf(uploaded_file)
+            df = extract_dimensions_from_pdf(uploaded_file.getvalue())
             
-            if data:
-                # Create DataFrame
+            if not df.empty:
                 columns = ["Sr. No.", "Parameter", "Nominal Value", "Tolerance", "Type (C/S)", "Instrument"]
                 if include_page_ref:
                     columns.append("Page")
-                
-                df = pd.DataFrame(data, columns=columns)
-                df = df.sort_values("Sr. No.").reset_index(drop=True)
+                df = df[columns]
                 
                 # Display statistics
                 col1, col2, col3, col4 = st.columns(4)
@@ -236,9 +315,9 @@ if uploaded_file:
                     st.metric("Pages Processed", df["Page"].nunique() if include_page_ref else "N/A")
                 
                 # Show parameter distribution
+                param_counts = df["Parameter"].value_counts()
                 if show_preview:
                     st.subheader("📊 Parameter Distribution")
-                    param_counts = df["Parameter"].value_counts()
                     st.bar_chart(param_counts)
                 
                 # Display the dataframe
@@ -273,49 +352,9 @@ if uploaded_file:
                 )
                 
                 # Export to Excel with enhanced formatting
-                output = io.BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    # Write main data
-                    filtered_df.to_excel(writer, sheet_name='Dimensions', index=False)
-                    
-                    # Create summary sheet
-                    summary_data = {
-                        'Parameter Type': param_counts.index.tolist(),
-                        'Count': param_counts.values.tolist()
-                    }
-                    summary_df = pd.DataFrame(summary_data)
-                    summary_df.to_excel(writer, sheet_name='Summary', index=False)
-                    
-                    # Format the main sheet
-                    workbook = writer.book
-                    worksheet = writer.sheets['Dimensions']
-                    
-                    # Add formatting
-                    header_format = workbook.add_format({
-                        'bold': True,
-                        'text_wrap': True,
-                        'valign': 'top',
-                        'fg_color': '#D7E4BC',
-                        'border': 1
-                    })
-                    
-                    # Apply header formatting
-                    for col_num, value in enumerate(filtered_df.columns.values):
-                        worksheet.write(0, col_num, value, header_format)
-                    
-                    # Auto-adjust column widths
-                    for i, col in enumerate(filtered_df.columns):
-                        max_length = max(
-                            filtered_df[col].astype(str).map(len).max(),
-                            len(col)
-                        )
-                        worksheet.set_column(i, i, min(max_length + 2, 20))
-                
-                output.seek(0)
-                
                 st.download_button(
                     label="📥 Download Excel File",
-                    data=output.getvalue(),
+                    data=build_xlsx(filtered_df, param_counts),
                     file_name=f"extracted_dimensions_{uploaded_file.name.split('.')[0]}.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )